@@ -0,0 +1,67 @@
+"""Compares `map`, `filter` and `reduce` with and without `vectorized=True`.
+
+Run with `python benchmarks/vectorized.py`.
+"""
+import collections
+import timeit
+
+import numpy as np
+
+import nifty_nesting as nest
+
+
+Layer = collections.namedtuple('Layer', ['weights', 'bias'])
+
+
+def numeric_config(num_sections=1000, num_values=100):
+    """A large numeric config with about `num_sections * (num_values + 6)` scalars."""
+    return {
+        'section_{}'.format(i): {
+            'values': [float(j) for j in range(num_values)],
+            'layer': Layer(weights=(0.5, -0.5, 1.5), bias=-1.),
+            'enabled': i % 2,
+            'rate': 1e-3 * i,
+        }
+        for i in range(num_sections)
+    }
+
+
+def array_config(num_arrays=20, size=100000):
+    return {'array_{}'.format(i): np.arange(float(size)) for i in range(num_arrays)}
+
+
+def ragged_array_config(num_arrays=1000):
+    return {'array_{}'.format(i): np.arange(float(i % 50 + 1)) for i in range(num_arrays)}
+
+
+def _time(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    cases = [
+        ('map, numeric config', numeric_config(),
+         lambda s: nest.map(lambda x: x * 2, s),
+         lambda s: nest.map(lambda x: x * 2, s, vectorized=True)),
+        ('filter, numeric config', numeric_config(),
+         lambda s: nest.filter(lambda x: x > 0, s),
+         lambda s: nest.filter(lambda x: x > 0, s, vectorized=True)),
+        ('reduce, numeric config', numeric_config(),
+         lambda s: nest.reduce(lambda x, y: x + y, s),
+         lambda s: nest.reduce(np.add, s, vectorized=True)),
+        ('map, large arrays', array_config(),
+         lambda s: nest.map(lambda x: x * 2, s),
+         lambda s: nest.map(lambda x: x * 2, s, vectorized=True)),
+        ('map, ragged arrays', ragged_array_config(),
+         lambda s: nest.map(np.sqrt, s),
+         lambda s: nest.map(np.sqrt, s, vectorized=True)),
+    ]
+    print('{:<26}{:>12}{:>12}{:>9}'.format('case', 'plain (s)', 'vector (s)', 'speedup'))
+    for name, structure, plain, vectorized in cases:
+        plain_time = _time(lambda: plain(structure))
+        vectorized_time = _time(lambda: vectorized(structure))
+        print('{:<26}{:>12.4f}{:>12.4f}{:>8.1f}x'.format(name, plain_time, vectorized_time, plain_time / vectorized_time))
+
+
+if __name__ == '__main__':
+    main()
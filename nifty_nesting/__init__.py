@@ -1,5 +1,7 @@
+from .nifty_nesting import Accumulator
 from .nifty_nesting import assert_same_structure
 from .nifty_nesting import filter
+from .nifty_nesting import filter_inplace
 from .nifty_nesting import flatten
 from .nifty_nesting import has_max_depth
 from .nifty_nesting import is_attrs_object
@@ -9,13 +11,18 @@ from .nifty_nesting import is_scalar
 from .nifty_nesting import is_sequence
 from .nifty_nesting import is_set
 from .nifty_nesting import map
+from .nifty_nesting import map_inplace
 from .nifty_nesting import pack_list_into
 from .nifty_nesting import reduce
+from .nifty_nesting import Schema
+from .nifty_nesting import to_schema
 
 name = 'nifty_nesting'
 
-__all__ = ['assert_same_structure',
+__all__ = ['Accumulator',
+           'assert_same_structure',
            'filter',
+           'filter_inplace',
            'flatten',
            'has_max_depth',
            'is_attrs_object',
@@ -25,5 +32,8 @@ __all__ = ['assert_same_structure',
            'is_set',
            'is_sequence',
            'map',
+           'map_inplace',
            'pack_list_into',
-           'reduce']
+           'reduce',
+           'Schema',
+           'to_schema']
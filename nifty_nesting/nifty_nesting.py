@@ -1,7 +1,17 @@
 """Python utilities for manipulating arbitrarily nested data structures."""
+import array
 import collections
+import itertools
+import threading
+import weakref
+
 import six
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # pylint: disable=line-too-long
 # pylint: disable=redefined-builtin
 
@@ -153,7 +163,7 @@ def flatten(structure, is_atomic=is_scalar):
     return flat_list
 
 
-def map(func, structure, is_atomic=is_scalar):
+def map(func, structure, is_atomic=is_scalar, vectorized=False):
     """Maps the atomic elements of `structure`.
 
     ```
@@ -161,6 +171,8 @@ def map(func, structure, is_atomic=is_scalar):
     structure = {'a': [1, 2], 'b': (3, 4, {'c': 5})}
     mapped = nest.map(lambda x: 2*x, structure)
     assert mapped == {'a': [2, 4], 'b': (6, 8, {'c': 10})}
+
+    mapped = nest.map(numpy.sqrt, structure, vectorized=True)
     ```
 
     Arguments:
@@ -169,11 +181,21 @@ def map(func, structure, is_atomic=is_scalar):
       is_atomic: A function that returns `True` if a certain element
         of `structure` ought to be treated as an atomic element, i.e.
         not as part of the nesting structure.
+      vectorized: If `True`, the atomic elements, which must be numbers or
+        NumPy arrays, are gathered into a single NumPy array and `func` is
+        called once on that array. `func` must then be elementwise, e.g. a
+        ufunc, and return an array of the same shape. Requires `numpy`.
+        The elements are converted to a common dtype, so mapping `[1, 2.5]`
+        returns floats only. NumPy arrays are returned as arrays, while other
+        elements, including NumPy scalars, are returned as Python scalars.
 
     Returns:
       A structure with the same structure as `structure`, with the atomic elements
         mapped according to `func`.
     """
+    if vectorized:
+        return _vectorized_map(func, structure, is_atomic)
+
     if structure is None:
         return None
 
@@ -197,7 +219,7 @@ def map(func, structure, is_atomic=is_scalar):
         'Encountered an element that was neither atomic nor a structure: {}'.format(structure))
 
 
-def reduce(func, structure, is_atomic=is_scalar):
+def reduce(func, structure, is_atomic=is_scalar, vectorized=False):
     """Reduces the atomic elements of `structure`.
 
     ```
@@ -205,6 +227,9 @@ def reduce(func, structure, is_atomic=is_scalar):
     structure = {'a': [1, 2], 'b': (3, 4, {'c': 5})}
     reduced = nest.reduce(lambda x, y: x+y, structure)
     assert reduced == 15
+
+    reduced = nest.reduce(numpy.add, structure, vectorized=True)
+    assert reduced == 15
     ```
 
     Arguments:
@@ -213,6 +238,11 @@ def reduce(func, structure, is_atomic=is_scalar):
       is_atomic: A function that returns `True` if a certain element
         of `structure` ought to be treated as an atomic element, i.e.
         not as part of the nesting structure.
+      vectorized: If `True`, `func` must be a ufunc such as `numpy.add`, and
+        the atomic elements, which must be numbers or NumPy arrays of the same
+        shape, are reduced at once with `func.reduce`. Requires `numpy`.
+        The elements are converted to a common dtype before being reduced, and
+        a scalar result is returned as a Python scalar.
 
     Returns:
       The reduced value.
@@ -220,6 +250,9 @@ def reduce(func, structure, is_atomic=is_scalar):
     if structure is None:
         return None
 
+    if vectorized:
+        return _vectorized_reduce(func, structure, is_atomic)
+
     for i, element in enumerate(flatten(structure, is_atomic)):
         if i == 0:
             reduced = element
@@ -228,7 +261,7 @@ def reduce(func, structure, is_atomic=is_scalar):
     return reduced
 
 
-def filter(func, structure, keep_structure=True, is_atomic=is_scalar):
+def filter(func, structure, keep_structure=True, is_atomic=is_scalar, vectorized=False):
     """Filters the atomic elements of `structure`.
 
     ```
@@ -239,6 +272,9 @@ def filter(func, structure, keep_structure=True, is_atomic=is_scalar):
 
     filtered = nest.filter(lambda x: x > 2, structure, keep_structure=False)
     assert filtered == {'b': (3, 4, {'c': 5})}
+
+    filtered = nest.filter(lambda x: x > 2, structure, vectorized=True)
+    assert filtered == {'a': [], 'b': (3, 4, {'c': 5})}
     ```
 
     Arguments:
@@ -250,10 +286,18 @@ def filter(func, structure, keep_structure=True, is_atomic=is_scalar):
       is_atomic: A function that returns `True` if a certain element
         of `structure` ought to be treated as an atomic element, i.e.
         not as part of the nesting structure.
+      vectorized: If `True`, the atomic elements, which must be numbers, are
+        gathered into a single NumPy array and `func` is called once on that
+        array. `func` must then return a boolean array of the same shape.
+        Requires `numpy`. `func` sees the elements converted to a common
+        dtype, but the kept elements are returned unchanged.
 
     Returns:
       The filtered elements of `structure` in the same structure as `structure`.
     """
+    if vectorized:
+        return _vectorized_filter(func, structure, keep_structure, is_atomic)
+
     class FALSEY:
         """Used as a placeholder for values we want to filter out."""
         pass
@@ -311,6 +355,174 @@ def filter(func, structure, keep_structure=True, is_atomic=is_scalar):
         return filtered_structure
 
 
+def map_inplace(func, structure, is_atomic=is_scalar):
+    """Maps the atomic elements of `structure`, modifying mutable structures in place.
+
+    Mutable structures (`list`s, `dict`s, `set`s and attrs objects that are
+    not frozen) are updated in place and returned. Immutable structures such
+    as `tuple`s, `namedtuple`s and frozen attrs objects are rebuilt, as in
+    `map`.
+
+    ```
+    import nifty_nesting as nest
+    structure = {'a': [1, 2], 'b': (3, 4, {'c': 5})}
+    mapped = nest.map_inplace(lambda x: 2*x, structure)
+    assert mapped is structure
+    assert mapped == {'a': [2, 4], 'b': (6, 8, {'c': 10})}
+    ```
+
+    Arguments:
+      func: The function to use to map atomic elements of `structure`.
+      structure: An arbitrarily nested structure of elements.
+      is_atomic: A function that returns `True` if a certain element
+        of `structure` ought to be treated as an atomic element, i.e.
+        not as part of the nesting structure.
+
+    Returns:
+      `structure` if it is mutable, else a new structure with the same
+        structure as `structure`, with the atomic elements mapped according
+        to `func`.
+    """
+    if structure is None:
+        return None
+
+    if is_atomic(structure):
+        return func(structure)
+
+    if is_attrs_object(structure):
+        mapped = [map_inplace(func, substructure, is_atomic) for substructure in _iter_attrs(structure)]
+        if _set_attrs(structure, mapped):
+            return structure
+        return _shallow_structure_like(structure, mapped, is_atomic)
+
+    if isinstance(structure, collections.MutableSequence):
+        for i, substructure in enumerate(structure):
+            structure[i] = map_inplace(func, substructure, is_atomic)
+        return structure
+
+    if is_sequence(structure) or is_set(structure):
+        mapped = [map_inplace(func, substructure, is_atomic) for substructure in structure]
+        if is_set(structure):
+            structure.clear()
+            structure.update(mapped)
+            return structure
+        return _shallow_structure_like(structure, mapped, is_atomic)
+
+    if isinstance(structure, collections.MutableMapping):
+        for key in _sorted_keys(structure):
+            structure[key] = map_inplace(func, structure[key], is_atomic)
+        return structure
+
+    if is_mapping(structure):
+        mapped = [map_inplace(func, structure[key], is_atomic) for key in _sorted_keys(structure)]
+        return _shallow_structure_like(structure, mapped, is_atomic)
+
+    raise ValueError(
+        'Encountered an element that was neither atomic nor a structure: {}'.format(structure))
+
+
+def filter_inplace(func, structure, keep_structure=True, is_atomic=is_scalar):
+    """Filters the atomic elements of `structure`, modifying mutable structures in place.
+
+    Filtered out elements are removed from mutable structures (`list`s,
+    `dict`s, `set`s and attrs objects that are not frozen) in place.
+    Immutable structures such as `tuple`s, `namedtuple`s and frozen attrs
+    objects are rebuilt, as in `filter`.
+
+    ```
+    import nifty_nesting as nest
+    structure = {'a': [1, 2], 'b': (3, 4, {'c': 5})}
+    filtered = nest.filter_inplace(lambda x: x > 2, structure, keep_structure=False)
+    assert filtered is structure
+    assert filtered == {'b': (3, 4, {'c': 5})}
+    ```
+
+    Arguments:
+      func: The function to use to filter atomic elements of `structure`.
+      structure: An arbitrarily nested structure of elements.
+      keep_structure: Whether or not to preserve empty substructures. If
+        `True`, these structures will be kept. If `False`, they will be
+        entirely filtered out.
+      is_atomic: A function that returns `True` if a certain element
+        of `structure` ought to be treated as an atomic element, i.e.
+        not as part of the nesting structure.
+
+    Returns:
+      The filtered elements of `structure` in the same structure as `structure`.
+        This is `structure` itself if it is mutable.
+    """
+    class FALSEY:
+        """Used as a placeholder for values we want to filter out."""
+        pass
+
+    def _filter_helper(structure):
+
+        if structure is None:
+            return FALSEY
+
+        if is_atomic(structure):
+            if func(structure):
+                return structure
+            return FALSEY
+
+        # Fields that evaluate to false are set to `None`, as in `filter`.
+        if is_attrs_object(structure) or is_namedtuple(structure):
+            filtered_list = [_filter_helper(substructure) for substructure in _shallow_yield_from(structure, is_atomic)]
+            if keep_structure or not all(element is FALSEY for element in filtered_list):
+                filtered_list = [None if element is FALSEY else element for element in filtered_list]
+                if is_attrs_object(structure) and _set_attrs(structure, filtered_list):
+                    return structure
+                return _shallow_structure_like(structure, filtered_list)
+            return FALSEY
+
+        # Remove elements that evaluate to false.
+        if is_sequence(structure) or is_set(structure):
+            filtered_list = []
+            for substructure in _shallow_yield_from(structure, is_atomic):
+                filtered_substructure = _filter_helper(substructure)
+                if filtered_substructure is not FALSEY:
+                    filtered_list.append(filtered_substructure)
+            if isinstance(structure, collections.MutableSequence):
+                structure[:] = filtered_list
+            elif is_set(structure):
+                structure.clear()
+                structure.update(filtered_list)
+            else:
+                structure = _shallow_structure_like(structure, filtered_list)
+            # If not `keep_structures`, don't return empty structures.
+            if keep_structure or filtered_list:
+                return structure
+            return FALSEY
+
+        # Remove keys whose elements evaluate to false.
+        if is_mapping(structure):
+            filtered_dict = {}
+            for key in _sorted_keys(structure):
+                filtered_substructure = _filter_helper(structure[key])
+                if filtered_substructure is not FALSEY:
+                    filtered_dict[key] = filtered_substructure
+            if isinstance(structure, collections.MutableMapping):
+                for key in _sorted_keys(structure):
+                    if key in filtered_dict:
+                        structure[key] = filtered_dict[key]
+                    else:
+                        del structure[key]
+            else:
+                structure = _shallow_structure_like(structure, filtered_dict)
+            if keep_structure or filtered_dict:
+                return structure
+            return FALSEY
+
+        raise ValueError(
+            'Encountered an element that was neither atomic nor a structure: {}'.format(structure))
+
+    filtered_structure = _filter_helper(structure)
+    if filtered_structure is FALSEY:
+        return None
+    else:
+        return filtered_structure
+
+
 def assert_same_structure(structure1, structure2, is_atomic=is_scalar):
     """Asserts that `structure1` and `structure2` have the same nested structure.
 
@@ -389,6 +601,560 @@ def pack_list_into(structure, flat_list, is_atomic=is_scalar):
     return packed_structure
 
 
+# Node kinds used by `Schema`.
+_LEAF = 0
+_NONE = 1
+_COLLECTION = 2  # Rebuilt with `type(elements)`: sequences and sets.
+_RECORD = 3  # Rebuilt with `type(*elements)`: namedtuples and attrs objects.
+_MAPPING = 4  # Rebuilt with `type(zip(keys, elements))`.
+
+# Guards the interning tables and `_schemas`. Reentrant because releasing a
+# schema's values from a weakref callback can happen while it is held.
+_schema_lock = threading.RLock()
+
+
+class _InternTable(object):
+    """Interns values and counts their uses, freeing values that are no longer used."""
+
+    def __init__(self):
+        self._values = []
+        self._counts = []
+        self._ids = {}
+        self._free_ids = []
+
+    def __getitem__(self, i):
+        return self._values[i]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def acquire(self, value):
+        """Returns the id of `value`, interning it if needed, and counts one use."""
+        key = _intern_key(value)
+        with _schema_lock:
+            i = self._ids.get(key)
+            if i is None:
+                if self._free_ids:
+                    i = self._free_ids.pop()
+                    self._values[i] = value
+                else:
+                    i = len(self._values)
+                    self._values.append(value)
+                    self._counts.append(0)
+                self._ids[key] = i
+            self._counts[i] += 1
+            return i
+
+    def release(self, ids):
+        """Counts one less use of every id in `ids`, freeing unused values."""
+        with _schema_lock:
+            for i in ids:
+                self._counts[i] -= 1
+                if self._counts[i] == 0:
+                    del self._ids[_intern_key(self._values[i])]
+                    self._values[i] = None
+                    self._free_ids.append(i)
+
+
+# Type objects and mapping key tuples are interned in tables shared by every
+# `Schema`, which only store indices into them. Values are freed once no
+# schema uses them anymore.
+_schema_types = _InternTable()
+_schema_keys = _InternTable()
+
+# Maps every live `Schema` to a weak reference to itself, so that identical
+# schemas can be deduplicated without keeping them alive.
+_schemas = weakref.WeakKeyDictionary()
+
+
+class Schema(object):
+    """A compact, immutable description of the nesting structure of `structure`.
+
+    Node kinds and child counts are stored in `array` buffers in the order
+    in which `flatten` visits them, and type objects and mapping keys are
+    interned in shared tables. Schemas are created with `to_schema`, which
+    returns a single shared instance for identical structures, so two
+    schemas describe the same structure if and only if they are the same
+    object.
+
+    ```
+    import nifty_nesting as nest
+    schema = nest.to_schema({'a': [1, 2], 'b': (3, 4, {'c': 5})})
+    assert schema is nest.to_schema({'a': [5, 6], 'b': (7, 8, {'c': 9})})
+    packed = schema.pack([2, 4, 6, 8, 10])
+    assert packed == {'a': [2, 4], 'b': (6, 8, {'c': 10})}
+    ```
+    """
+
+    __slots__ = ('_kinds', '_sizes', '_types', '_keys', '_num_leaves', '_hash', '__weakref__')
+
+    def __init__(self, kinds, sizes, types, keys):
+        self._kinds = kinds
+        self._sizes = sizes
+        self._types = types
+        self._keys = keys
+        self._num_leaves = kinds.count(_LEAF)
+        self._hash = hash((_array_bytes(kinds), _array_bytes(sizes), _array_bytes(types), _array_bytes(keys)))
+
+    @property
+    def num_leaves(self):
+        """The number of atomic elements in the structure."""
+        return self._num_leaves
+
+    def pack(self, flat_list):
+        """Packs the elements of `flat_list` into the structure described by this schema.
+
+        Arguments:
+          flat_list: A flat list with `num_leaves` elements, e.g. as returned
+            by `flatten`.
+
+        Returns:
+          A structure with the elements of `flat_list` as its atomic elements.
+        """
+        if len(flat_list) != self._num_leaves:
+            raise ValueError('Expected {} elements, found {}.'.format(self._num_leaves, len(flat_list)))
+        return self._build(iter(flat_list))
+
+    def to_template(self):
+        """Returns a structure that can be used as a template for `pack_list_into`.
+
+        The atomic elements of the template are their indices in the flattened
+        structure. `None` elements are kept as `None`, which `flatten` skips
+        but `pack_list_into` treats as atomic elements, so use `pack` for
+        structures that contain `None`.
+        """
+        return self._build(iter(range(self._num_leaves)))
+
+    def matches(self, structure, is_atomic=is_scalar):
+        """Returns `True` if `structure` has the structure described by this schema."""
+        return to_schema(structure, is_atomic) is self
+
+    def _build(self, leaves):
+        kinds = iter(self._kinds)
+        sizes = iter(self._sizes)
+        types = iter(self._types)
+        keys = iter(self._keys)
+
+        def _build_helper():
+            kind = next(kinds)
+            if kind == _LEAF:
+                return next(leaves)
+            if kind == _NONE:
+                return None
+            size = next(sizes)
+            structure_type = _schema_types[next(types)]
+            if kind == _MAPPING:
+                # Keys are stored in visiting order, so read them before any child.
+                key_tuple = _schema_keys[next(keys)]
+            else:
+                key_tuple = None
+            return _rebuild(kind, structure_type, key_tuple, [_build_helper() for _ in range(size)])
+
+        return _build_helper()
+
+    def __eq__(self, other):
+        if not isinstance(other, Schema):
+            return NotImplemented
+        return (self._hash == other._hash
+                and self._kinds == other._kinds
+                and self._sizes == other._sizes
+                and self._types == other._types
+                and self._keys == other._keys)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # Table indices are only meaningful within a process, so pickle the
+        # interned objects themselves.
+        return (_unpickle_schema,
+                (_array_bytes(self._kinds),
+                 list(self._sizes),
+                 [_schema_types[i] for i in self._types],
+                 [_schema_keys[i] for i in self._keys]))
+
+    def __repr__(self):
+        return 'Schema(num_nodes={}, num_leaves={})'.format(len(self._kinds), self._num_leaves)
+
+
+def to_schema(structure, is_atomic=is_scalar):
+    """Returns the `Schema` describing the nesting structure of `structure`.
+
+    Identical structures share a single `Schema` instance, so memory scales
+    with the number of distinct structures rather than with the number of
+    calls.
+
+    ```
+    import nifty_nesting as nest
+    schema = nest.to_schema([1, (2, {'a': 3})])
+    assert schema.num_leaves == 3
+    assert schema.matches(['a', ('b', {'a': 'c'})])
+    ```
+
+    Arguments:
+      structure: An arbitrarily nested structure of elements.
+      is_atomic: A function that returns `True` if a certain element
+        of `structure` ought to be treated as an atomic element, i.e.
+        not as part of the nesting structure.
+
+    Returns:
+      The shared `Schema` for the structure of `structure`.
+    """
+    _, schema = _flatten_to_schema(structure, is_atomic)
+    return schema
+
+
+def _flatten_to_schema(structure, is_atomic):
+    """Returns both `flatten(structure)` and `to_schema(structure)` in a single pass."""
+    flat_list, layout = _flatten_to_layout(structure, is_atomic)
+    kinds = array.array('B')
+    sizes = array.array('L')
+    types = array.array('L')
+    keys = array.array('L')
+    for kind, structure_type, size, key_tuple in layout:
+        kinds.append(kind)
+        if kind == _MAPPING:
+            keys.append(_schema_keys.acquire(key_tuple))
+        if kind not in (_LEAF, _NONE):
+            sizes.append(size)
+            types.append(_schema_types.acquire(structure_type))
+    return flat_list, _intern_schema(Schema(kinds, sizes, types, keys))
+
+
+# Exact types that `is_scalar` always treats as atomic.
+_SCALAR_TYPES = frozenset(six.integer_types + (float, bool, complex, bytes, six.text_type))
+if np is not None:
+    _SCALAR_TYPES |= frozenset(np.sctypeDict.values()) | frozenset([np.ndarray])
+
+# Layout nodes for atomic elements and `None`, see `_flatten_to_layout`.
+_LEAF_NODE = (_LEAF, None, 0, None)
+_NONE_NODE = (_NONE, None, 0, None)
+
+
+def _flatten_to_layout(structure, is_atomic):
+    """Returns `flatten(structure)` and the layout of `structure` in a single pass.
+
+    The layout lists a `(kind, type, size, keys)` node for every element in
+    the order in which `flatten` visits them. Unlike a `Schema`, it is not
+    interned, and it can be rebuilt with `_pack_layout` or `_filter_layout`
+    without calling `is_atomic` again.
+    """
+    flat_list = []
+    layout = []
+    # Elements of these exact types are atomic without calling `is_atomic`.
+    atomic_types = _SCALAR_TYPES if is_atomic is is_scalar else frozenset()
+
+    def _flatten_to_layout_helper(structure):
+        if structure is None:
+            layout.append(_NONE_NODE)
+            return
+        if type(structure) in atomic_types or is_atomic(structure):
+            layout.append(_LEAF_NODE)
+            flat_list.append(structure)
+            return
+
+        # Substructures are listed directly rather than with `_shallow_yield_from`,
+        # which would call `is_atomic` on `structure` again.
+        key_tuple = None
+        if is_attrs_object(structure):
+            kind = _RECORD
+            substructures = _iter_attrs(structure)
+        elif is_namedtuple(structure):
+            kind = _RECORD
+            substructures = list(structure)
+        elif is_sequence(structure) or is_set(structure):
+            kind = _COLLECTION
+            substructures = list(structure)
+        elif is_mapping(structure):
+            kind = _MAPPING
+            key_tuple = tuple(_sorted_keys(structure))
+            substructures = [structure[key] for key in key_tuple]
+        else:
+            raise ValueError(
+                'Encountered an element that was neither atomic nor a structure: {}'.format(structure))
+
+        layout.append((kind, type(structure), len(substructures), key_tuple))
+        for substructure in substructures:
+            # Atomic elements are handled inline to save a call per element.
+            if type(substructure) in atomic_types or (substructure is not None and is_atomic(substructure)):
+                layout.append(_LEAF_NODE)
+                flat_list.append(substructure)
+            else:
+                _flatten_to_layout_helper(substructure)
+
+    _flatten_to_layout_helper(structure)
+    return flat_list, layout
+
+
+def _pack_layout(layout, flat_list):
+    """Packs `flat_list` into the structure described by `layout`."""
+    nodes = iter(layout)
+    leaves = iter(flat_list)
+
+    def _pack_layout_helper(node):
+        kind, structure_type, size, key_tuple = node
+        if kind == _LEAF:
+            return next(leaves)
+        if kind == _NONE:
+            return None
+        elements = []
+        for _ in range(size):
+            # Atomic elements are handled inline to save a call per element.
+            child = next(nodes)
+            elements.append(next(leaves) if child is _LEAF_NODE else _pack_layout_helper(child))
+        return _rebuild(kind, structure_type, key_tuple, elements)
+
+    return _pack_layout_helper(next(nodes))
+
+
+def _filter_layout(layout, flat_list, keep, keep_structure):
+    """Rebuilds the structure described by `layout` as `filter` would.
+
+    `keep` holds whether to keep each element of `flat_list`.
+    """
+    FALSEY = object()
+    nodes = iter(layout)
+    leaves = iter(zip(flat_list, keep))
+
+    def _filter_layout_helper(node):
+        kind, structure_type, size, key_tuple = node
+        if kind == _LEAF:
+            element, keep_element = next(leaves)
+            return element if keep_element else FALSEY
+        if kind == _NONE:
+            return FALSEY
+
+        filtered_list = []
+        for _ in range(size):
+            child = next(nodes)
+            if child is _LEAF_NODE:
+                # Atomic elements are handled inline to save a call per element.
+                element, keep_element = next(leaves)
+                filtered_list.append(element if keep_element else FALSEY)
+            else:
+                filtered_list.append(_filter_layout_helper(child))
+        if kind == _RECORD:
+            # Fields that evaluate to false are set to `None`, as in `filter`.
+            if keep_structure or not all(element is FALSEY for element in filtered_list):
+                return structure_type(*[None if element is FALSEY else element for element in filtered_list])
+            return FALSEY
+        if kind == _MAPPING:
+            key_tuple = [key for key, element in zip(key_tuple, filtered_list) if element is not FALSEY]
+        filtered_list = [element for element in filtered_list if element is not FALSEY]
+        if keep_structure or filtered_list:
+            return _rebuild(kind, structure_type, key_tuple, filtered_list)
+        return FALSEY
+
+    filtered_structure = _filter_layout_helper(next(nodes))
+    if filtered_structure is FALSEY:
+        return None
+    return filtered_structure
+
+
+def _rebuild(kind, structure_type, key_tuple, elements):
+    if kind == _RECORD:
+        return structure_type(*elements)
+    if kind == _COLLECTION:
+        return structure_type(elements)
+    return structure_type(zip(key_tuple, elements))
+
+
+class Accumulator(object):
+    """Accumulates elementwise statistics over many structures with the same structure.
+
+    Atomic elements are accumulated into preallocated NumPy buffers that are
+    updated in place, so no intermediate structures are created. Scalar
+    elements share one contiguous buffer per statistic, and are accumulated in
+    a common dtype, while every NumPy array element has its own buffers. Atomic
+    elements must keep the same shape across structures. Requires `numpy`.
+
+    ```
+    import nifty_nesting as nest
+    accumulator = nest.Accumulator({'a': 0, 'b': [0, 0]})
+    accumulator.update([{'a': 1, 'b': [2, 3]}, {'a': 3, 'b': [4, 5]}])
+    assert accumulator.sum() == {'a': 4, 'b': [6, 8]}
+    assert accumulator.mean() == {'a': 2., 'b': [3., 4.]}
+    assert accumulator.max() == {'a': 3, 'b': [4, 5]}
+    ```
+
+    Arguments:
+      template: A structure with the same structure as the accumulated structures.
+      is_atomic: A function that returns `True` if a certain element
+        of `structure` ought to be treated as an atomic element, i.e.
+        not as part of the nesting structure. It must be picklable in order
+        to use a `pool` in `update`.
+      statistics: The statistics to accumulate, a subset of `'sum'`, `'min'`
+        and `'max'`. `mean` is computed from `'sum'`. Each statistic needs one
+        buffer per atomic element.
+    """
+
+    _UFUNCS = {'sum': 'add', 'min': 'minimum', 'max': 'maximum'}
+
+    def __init__(self, template, is_atomic=is_scalar, statistics=('sum', 'min', 'max')):
+        _require_numpy()
+        for statistic in statistics:
+            if statistic not in self._UFUNCS:
+                raise ValueError('Unknown statistic: {}'.format(statistic))
+        self._schema = to_schema(template, is_atomic)
+        self._is_atomic = is_atomic
+        self._statistics = tuple(statistics)
+        self._count = 0
+        # Indices in the flattened structure of the scalar and array elements,
+        # set by the first structure.
+        self._scalar_indices = None
+        self._array_indices = None
+        # Maps each statistic to a list of buffers: one for all scalar elements,
+        # followed by one per array element.
+        self._buffers = None
+
+    @property
+    def count(self):
+        """The number of structures accumulated so far."""
+        return self._count
+
+    def add(self, structure):
+        """Accumulates a single structure."""
+        flat, schema = _flatten_to_schema(structure, self._is_atomic)
+        if schema is not self._schema:
+            raise ValueError('Expected a structure like {}, found: {}'.format(self._schema.to_template(), structure))
+
+        if self._buffers is None:
+            self._scalar_indices = [i for i, element in enumerate(flat) if np.ndim(element) == 0]
+            self._array_indices = [i for i, element in enumerate(flat) if np.ndim(element) != 0]
+        elements = self._split_elements(flat)
+
+        if self._buffers is None:
+            self._buffers = dict((statistic, [_accumulator_buffer(statistic, element) for element in elements])
+                                 for statistic in self._statistics)
+        else:
+            self._check_shapes(elements)
+            for statistic in self._statistics:
+                ufunc = getattr(np, self._UFUNCS[statistic])
+                buffers = self._buffers[statistic]
+                for i, element in enumerate(elements):
+                    _accumulate_into(ufunc, buffers, i, element)
+        self._count += 1
+
+    def update(self, structures, pool=None, chunksize=256):
+        """Accumulates every structure in the iterable `structures`.
+
+        Arguments:
+          structures: An iterable of structures.
+          pool: An optional pool with an `imap_unordered` or a `map` method,
+            e.g. a `multiprocessing.Pool` or a
+            `concurrent.futures.ProcessPoolExecutor`. If given, `structures` is
+            split into shards that are accumulated by the pool, and the partial
+            accumulators are merged into this one. Shards are read lazily with
+            `imap_unordered`, while `map` may read every shard up front.
+          chunksize: The number of structures in each shard.
+        """
+        if pool is None:
+            for structure in structures:
+                self.add(structure)
+            return
+
+        def _shards():
+            iterator = iter(structures)
+            while True:
+                shard = list(itertools.islice(iterator, chunksize))
+                if not shard:
+                    return
+                yield self._empty_like(), shard
+
+        pool_map = getattr(pool, 'imap_unordered', None) or pool.map
+        for partial in pool_map(_accumulate_shard, _shards()):
+            self.merge(partial)
+
+    def merge(self, other):
+        """Merges the statistics accumulated by `other` into this accumulator."""
+        if other._schema is not self._schema or other._statistics != self._statistics:
+            raise ValueError('Cannot merge accumulators with different structures or statistics.')
+        if other._buffers is None:
+            return
+        if self._buffers is None:
+            self._scalar_indices = other._scalar_indices
+            self._array_indices = other._array_indices
+            self._buffers = dict((statistic, [buffer.copy() for buffer in buffers])
+                                 for statistic, buffers in six.iteritems(other._buffers))
+        else:
+            if other._scalar_indices != self._scalar_indices:
+                raise ValueError('Cannot merge accumulators with different scalar elements.')
+            for statistic in self._statistics:
+                self._check_shapes(other._buffers[statistic])
+                ufunc = getattr(np, self._UFUNCS[statistic])
+                buffers = self._buffers[statistic]
+                for i, other_buffer in enumerate(other._buffers[statistic]):
+                    _accumulate_into(ufunc, buffers, i, other_buffer)
+        self._count += other._count
+
+    def sum(self):
+        """Returns the elementwise sum of the accumulated structures."""
+        return self._pack([buffer.copy() for buffer in self._get_buffers('sum')])
+
+    def mean(self):
+        """Returns the elementwise mean of the accumulated structures."""
+        return self._pack([np.true_divide(buffer, self._count) for buffer in self._get_buffers('sum')])
+
+    def min(self):
+        """Returns the elementwise minimum of the accumulated structures."""
+        return self._pack([buffer.copy() for buffer in self._get_buffers('min')])
+
+    def max(self):
+        """Returns the elementwise maximum of the accumulated structures."""
+        return self._pack([buffer.copy() for buffer in self._get_buffers('max')])
+
+    def _get_buffers(self, statistic):
+        if statistic not in self._statistics:
+            raise ValueError('The statistic {} is not accumulated.'.format(statistic))
+        if self._buffers is None:
+            raise ValueError('No structures have been accumulated.')
+        return self._buffers[statistic]
+
+    def _split_elements(self, flat):
+        # Returns the scalar elements as one array, followed by the array elements.
+        try:
+            if self._array_indices:
+                scalars = np.asarray([flat[i] for i in self._scalar_indices])
+            else:
+                scalars = np.asarray(flat)
+        except ValueError:
+            raise ValueError('Expected scalar elements at indices {}.'.format(self._scalar_indices))
+        return [scalars] + [flat[i] for i in self._array_indices]
+
+    def _check_shapes(self, elements):
+        # The shape of every element is checked once, whatever the number of statistics.
+        buffers = self._buffers[self._statistics[0]]
+        for buffer, element in zip(buffers, elements):
+            if np.shape(element) != buffer.shape:
+                raise ValueError('Expected an element of shape {}, found {}.'.format(buffer.shape, np.shape(element)))
+
+    def _pack(self, buffers):
+        flat_list = [None] * self._schema.num_leaves
+        # Scalars are returned as NumPy scalars rather than 0-d arrays.
+        for i, scalar in zip(self._scalar_indices, buffers[0]):
+            flat_list[i] = scalar
+        for i, buffer in zip(self._array_indices, buffers[1:]):
+            flat_list[i] = buffer
+        return self._schema.pack(flat_list)
+
+    def _empty_like(self):
+        accumulator = Accumulator.__new__(Accumulator)
+        accumulator._schema = self._schema
+        accumulator._is_atomic = self._is_atomic
+        accumulator._statistics = self._statistics
+        accumulator._count = 0
+        accumulator._scalar_indices = None
+        accumulator._array_indices = None
+        accumulator._buffers = None
+        return accumulator
+
+
 def _shallow_structure_like(structure, elements, is_atomic=is_scalar):
     if structure is None:
         return None
@@ -423,6 +1189,26 @@ def _iter_attrs(element):
             getattr(element.__class__, '__attrs_attrs__')]
 
 
+def _set_attrs(element, values):
+    """Sets the attributes of an attrs object, returns `False` if any of them is frozen.
+
+    If an attribute cannot be set, the attributes set before it are restored,
+    so that `element` is left unchanged.
+    """
+    previous_values = []
+    try:
+        for attribute, value in zip(getattr(element.__class__, '__attrs_attrs__'), values):
+            previous_value = getattr(element, attribute.name)
+            setattr(element, attribute.name, value)
+            previous_values.append((attribute.name, previous_value))
+    except AttributeError:
+        # Bypass `on_setattr` hooks to restore the exact previous values.
+        for name, previous_value in reversed(previous_values):
+            object.__setattr__(element, name, previous_value)
+        return False
+    return True
+
+
 def _shallow_yield_from(structure, is_atomic=is_scalar):
     if is_atomic(structure):
         yield structure
@@ -436,5 +1222,151 @@ def _shallow_yield_from(structure, is_atomic=is_scalar):
         for substructure in structure:
             yield substructure
 
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('This functionality requires `numpy`, install it with `pip install numpy`.')
+
+
+def _vectorized_map(func, structure, is_atomic):
+    flat, layout = _flatten_to_layout(structure, is_atomic)
+    if not flat:
+        return map(func, structure, is_atomic)
+    buffer, offsets = _gather_leaves(flat)
+    return _pack_layout(layout, _scatter_leaves(_vectorized_call(func, buffer), flat, offsets))
+
+
+def _vectorized_filter(func, structure, keep_structure, is_atomic):
+    flat, layout = _flatten_to_layout(structure, is_atomic)
+    buffer, offsets = _gather_leaves(flat)
+    if offsets is not None or buffer.ndim != 1:
+        raise ValueError('Vectorized `filter` only supports scalar atomic elements.')
+    keep = _vectorized_call(func, buffer).astype(bool).tolist()
+    return _filter_layout(layout, flat, keep, keep_structure)
+
+
+def _vectorized_reduce(func, structure, is_atomic):
+    _require_numpy()
+    if not hasattr(func, 'reduce'):
+        raise ValueError('Vectorized `reduce` requires a ufunc such as `numpy.add`, found: {}'.format(func))
+    flat, _ = _flatten_to_layout(structure, is_atomic)
+    if not flat:
+        return None
+    buffer, offsets = _gather_leaves(flat)
+    if offsets is not None:
+        raise ValueError('Vectorized `reduce` requires atomic elements of the same shape.')
+    reduced = func.reduce(buffer, axis=0)
+    return reduced.item() if np.ndim(reduced) == 0 else reduced
+
+
+def _vectorized_call(func, buffer):
+    result = np.asarray(func(buffer))
+    if result.shape != buffer.shape:
+        raise ValueError('Vectorized functions must return an array of shape {}, found {}.'.format(buffer.shape, result.shape))
+    return result
+
+
+def _gather_leaves(flat_list):
+    """Gathers `flat_list` into one NumPy array, returns it and the offsets of the elements.
+
+    Elements of the same shape are stacked along a new first axis, and the
+    offsets are `None`. Otherwise they are raveled and concatenated.
+    """
+    _require_numpy()
+    try:
+        buffer = np.asarray(flat_list)
+    except ValueError:
+        # Recent NumPy versions refuse to stack ragged elements.
+        buffer = None
+    if buffer is not None and buffer.dtype != object:
+        return buffer, None
+    raveled = [np.ravel(element) for element in flat_list]
+    offsets = [0]
+    for element in raveled:
+        offsets.append(offsets[-1] + len(element))
+    return np.concatenate(raveled), offsets
+
+
+def _scatter_leaves(buffer, flat_list, offsets):
+    """Splits `buffer` back into elements shaped like those of `flat_list`.
+
+    NumPy arrays are returned as NumPy arrays, and scalars as Python scalars.
+    """
+    if offsets is None:
+        if buffer.ndim == 1 and not any(isinstance(original, np.ndarray) for original in flat_list):
+            return buffer.tolist()
+        # `buffer[i, ...]` is an array even when the elements are 0-d, and only
+        # the elements that were not arrays are converted to Python objects.
+        return [buffer[i, ...] if isinstance(original, np.ndarray) else buffer[i].tolist()
+                for i, original in enumerate(flat_list)]
+    return [buffer[start:stop].reshape(original.shape) if isinstance(original, np.ndarray) else buffer[start].item()
+            for original, start, stop in zip(flat_list, offsets, offsets[1:])]
+
+
+def _accumulator_buffer(statistic, element):
+    dtype = np.result_type(element)
+    # Sums of small integers and booleans are accumulated as `int` to avoid overflow.
+    if statistic == 'sum' and dtype.kind in 'biu':
+        dtype = np.promote_types(dtype, np.int_)
+    return np.array(element, dtype=dtype)
+
+
+def _accumulate_into(ufunc, buffers, i, element):
+    try:
+        ufunc(buffers[i], element, out=buffers[i])
+    except TypeError:
+        # The buffer's dtype was fixed by the first element, e.g. `int` for a
+        # metric that later becomes a `float`: widen it and try again.
+        buffers[i] = buffers[i].astype(np.result_type(buffers[i], element))
+        ufunc(buffers[i], element, out=buffers[i])
+
+
+def _accumulate_shard(args):
+    accumulator, structures = args
+    accumulator.update(structures)
+    return accumulator
+
+
+def _intern_key(value):
+    # Include the types, recursively, so that e.g. `(1,)`, `(1.,)` and `(True,)` are not conflated.
+    if isinstance(value, tuple):
+        return type(value), tuple(_map(_intern_key, value))
+    return type(value), value
+
+
+def _array_bytes(buffer):
+    # `array.tobytes` is called `tostring` on Python 2.
+    if six.PY2:
+        return buffer.tostring()
+    return buffer.tobytes()
+
+
+def _release_schema_ids(types, keys):
+    _schema_types.release(types)
+    _schema_keys.release(keys)
+
+
+def _intern_schema(schema):
+    # Every `Schema` holds one use of each of its interned values, which is
+    # released when it is deduplicated or garbage collected.
+    with _schema_lock:
+        existing = _schemas.get(schema)
+        if existing is not None:
+            existing = existing()
+            if existing is not None:
+                _release_schema_ids(schema._types, schema._keys)
+                return existing
+        types, keys = schema._types, schema._keys
+        _schemas[schema] = weakref.ref(schema, lambda _: _release_schema_ids(types, keys))
+        return schema
+
+
+def _unpickle_schema(kinds, sizes, types, keys):
+    return _intern_schema(Schema(
+        array.array('B', kinds),
+        array.array('L', sizes),
+        array.array('L', [_schema_types.acquire(value) for value in types]),
+        array.array('L', [_schema_keys.acquire(value) for value in keys])))
+
 # pylint: enable=line-too-long
 # pylint: enable=redefined-builtin
@@ -1,7 +1,17 @@
 import attr
 import collections
+import multiprocessing
+import multiprocessing.dummy
+import pickle
+import sys
+import threading
 import unittest as test
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import nifty_nesting as nest
 
 
@@ -15,6 +25,18 @@ class Coordinates(object):
     x = attr.ib()
     y = attr.ib()
 
+# Frozen attr classes are rebuilt rather than modified in place.
+@attr.s(frozen=True)
+class FrozenCoordinates(object):
+    x = attr.ib()
+    y = attr.ib()
+
+# attr classes with a frozen field are rebuilt as well.
+@attr.s
+class PartlyFrozenCoordinates(object):
+    x = attr.ib()
+    y = attr.ib(on_setattr=attr.setters.frozen)
+
 # Regular classes are not part of the structure.
 class Blah:
     def __init__(self):
@@ -87,6 +109,43 @@ class MapTest(test.TestCase):
         mapped = nest.map(lambda x: x[0], s, is_atomic=lambda x: isinstance(x, list))
 
 
+class MapInplaceTest(test.TestCase):
+
+    def test_none(self):
+        self.assertEqual(nest.map_inplace(lambda x: 2*x, None), None)
+
+    def test_single_element(self):
+        self.assertEqual(nest.map_inplace(lambda x: 2*x, 4), 8)
+
+    def test_nested(self):
+        inner = [3, 4, {5, 6}]
+        coordinates = Coordinates(9, [10])
+        s = {'a': 1, 'b': (2, inner), 'c': Point(7, 8), 'd': coordinates, 'e': FrozenCoordinates(11, 12)}
+        m = {'a': 2, 'b': (4, [6, 8, {10, 12}]), 'c': Point(14, 16), 'd': Coordinates(18, [20]), 'e': FrozenCoordinates(22, 24)}
+        mapped = nest.map_inplace(lambda x: 2*x, s)
+        self.assertIs(mapped, s)
+        self.assertIs(mapped['b'][1], inner)
+        self.assertIs(mapped['d'], coordinates)
+        self.assertEqual(mapped, m)
+
+    def test_partly_frozen(self):
+        s = PartlyFrozenCoordinates(1, 2)
+        mapped = nest.map_inplace(lambda x: 10*x, s)
+        self.assertEqual(mapped, PartlyFrozenCoordinates(10, 20))
+        self.assertIsNot(mapped, s)
+        self.assertEqual(s, PartlyFrozenCoordinates(1, 2))
+
+        s = [PartlyFrozenCoordinates(1, 2)]
+        filtered = nest.filter_inplace(lambda x: x > 1, s)
+        self.assertEqual(filtered, [PartlyFrozenCoordinates(None, 2)])
+        self.assertIs(filtered, s)
+
+    def test_atomic(self):
+        s = {'a': [1, 2, 3], 'b': [4, 5, 6], 'c': ([7, 8, 9], [10, 11, 12])}
+        mapped = nest.map_inplace(lambda x: x[0], s, is_atomic=lambda x: isinstance(x, list))
+        self.assertEqual(mapped, {'a': 1, 'b': 4, 'c': (7, 10)})
+
+
 class PackIntoTest(test.TestCase):
 
     def test_none(self):
@@ -140,6 +199,33 @@ class FilterTest(test.TestCase):
         self.assertEqual(f, {'b': 2, 'c': [4, {6}, (8,)], 'd': Point(10, None), 'e': Coordinates(12, None)})
 
 
+class FilterInplaceTest(test.TestCase):
+
+    def test_none(self):
+        self.assertEqual(nest.filter_inplace(lambda x: x, None), None)
+
+    def test_single_element(self):
+        self.assertEqual(nest.filter_inplace(lambda x: x != 'string', 'string'), None)
+        self.assertEqual(nest.filter_inplace(lambda x: x == 'string', 'string'), 'string')
+
+    def test_nested(self):
+        inner = [3, 4, 5, {6, 7}, (8, 9)]
+        s = {'a': 1, 'b': 2, 'c': inner, 'd': Point(10, 11), 'e': Coordinates(12, 13), 'f': FrozenCoordinates(14, 15)}
+        f = nest.filter_inplace(lambda x: x % 2 == 0, s)
+        self.assertIs(f, s)
+        self.assertIs(f['c'], inner)
+        self.assertEqual(f, {'b': 2, 'c': [4, {6}, (8,)], 'd': Point(10, None), 'e': Coordinates(12, None),
+                             'f': FrozenCoordinates(14, None)})
+
+    def test_matches_filter(self):
+        def make():
+            return {'a': [1, 2], 'b': (3, 4, {'c': 5}), 'd': {'e': [1]}, 'f': Coordinates(1, 3)}
+        for keep_structure in [True, False]:
+            expected = nest.filter(lambda x: x > 2, make(), keep_structure=keep_structure)
+            f = nest.filter_inplace(lambda x: x > 2, make(), keep_structure=keep_structure)
+            self.assertEqual(f, expected)
+
+
 class AssertSameStructureTest(test.TestCase):
 
     def test_none(self):
@@ -195,6 +281,328 @@ class ReduceTest(test.TestCase):
         self.assertEqual(r, Point(10, 11))
 
 
+class SchemaTest(test.TestCase):
+
+    def test_none(self):
+        schema = nest.to_schema(None)
+        self.assertEqual(schema.num_leaves, 0)
+        self.assertEqual(schema.pack([]), None)
+
+    def test_single_element(self):
+        schema = nest.to_schema('string')
+        self.assertEqual(schema.num_leaves, 1)
+        self.assertEqual(schema.pack(['expected']), 'expected')
+
+    def test_nested(self):
+        s = {'a': 1, 'b': None, 'c': [3, 4, 5, {6, 7}, (8, 9)], 'd': Point(10, 11), 'e': Coordinates(12, 13)}
+        schema = nest.to_schema(s)
+        self.assertEqual(schema.num_leaves, 12)
+        self.assertEqual(schema.pack(nest.flatten(s)), s)
+        s = {'a': [1, {'b': 2}], 'c': {'d': {'e': 3}}}
+        self.assertEqual(nest.to_schema(s).pack([4, 5, 6]), {'a': [4, {'b': 5}], 'c': {'d': {'e': 6}}})
+        with self.assertRaises(ValueError):
+            schema.pack([1, 2])
+
+    def test_template(self):
+        s = {'a': 1, 'c': [3, 4, 5, {6, 7}, (8, 9)], 'd': Point(10, 11), 'e': Coordinates(12, 13)}
+        template = nest.to_schema(s).to_template()
+        self.assertEqual(template, {'a': 0, 'c': [1, 2, 3, {4, 5}, (6, 7)], 'd': Point(8, 9), 'e': Coordinates(10, 11)})
+        l = [2, 4, 6, 8, 10, 12, 14, 16, 18, 20, 22, 24]
+        self.assertEqual(nest.pack_list_into(template, l), nest.pack_list_into(s, l))
+
+        s = {'a': 1, 'b': None, 'c': 2}
+        schema = nest.to_schema(s)
+        self.assertEqual(schema.to_template(), {'a': 0, 'b': None, 'c': 1})
+        self.assertEqual(schema.pack([10, 20]), {'a': 10, 'b': None, 'c': 20})
+        # `pack_list_into` treats `None` as an atomic element, unlike `flatten`.
+        with self.assertRaises(IndexError):
+            nest.pack_list_into(schema.to_template(), [10, 20])
+
+    def test_interning(self):
+        s1 = {'a': [1, 2], 'b': (3, Point(4, 5))}
+        s2 = {'a': ['x', 'y'], 'b': ('z', Point('v', 'w'))}
+        s3 = {'a': [1, 2], 'b': [3, Point(4, 5)]}
+        self.assertIs(nest.to_schema(s1), nest.to_schema(s2))
+        self.assertIsNot(nest.to_schema(s1), nest.to_schema(s3))
+        self.assertIsNot(nest.to_schema({1: 'a'}), nest.to_schema({True: 'a'}))
+        self.assertIsNot(nest.to_schema({(1,): 'a'}), nest.to_schema({(True,): 'a'}))
+        self.assertEqual(nest.to_schema({((1,), 2): 'a'}).pack(['b']), {((1,), 2): 'b'})
+        self.assertIsInstance(list(nest.to_schema({((True,), 2): 'a'}).pack(['b']))[0][0][0], bool)
+        self.assertTrue(nest.to_schema(s1).matches(s2))
+        self.assertFalse(nest.to_schema(s1).matches(s3))
+
+    def test_frees_unused_values(self):
+        tables = nest.nifty_nesting._schema_keys, nest.nifty_nesting._schema_types
+        sizes = [len(table) for table in tables]
+        schema = nest.to_schema({'unused_key': collections.namedtuple('Unused', ['x'])(1)})
+        self.assertEqual(len(tables[0]), sizes[0] + 1)
+        self.assertGreater(len(tables[1]), sizes[1])
+        del schema
+        for i in range(100):
+            nest.to_schema({'key_{}'.format(i): 1})
+        self.assertEqual([len(table) for table in tables], sizes)
+        with self.assertRaises(ValueError):
+            nest.to_schema({'unsortable': [{1: 'a', 'b': 2}]})
+        self.assertEqual([len(table) for table in tables], sizes)
+
+    def test_threads(self):
+        errors = []
+
+        def work():
+            try:
+                for i in range(3000):
+                    schema = nest.to_schema({'k{}'.format(i % 50): [1, {'z{}'.format(i % 7): 2}]})
+                    self.assertEqual(schema.to_template(), {'k{}'.format(i % 50): [0, {'z{}'.format(i % 7): 1}]})
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        # Switch threads often to make races likely. Python 2 has no switch interval.
+        switch_interval = getattr(sys, 'getswitchinterval', lambda: None)()
+        if switch_interval is not None:
+            sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if switch_interval is not None:
+                sys.setswitchinterval(switch_interval)
+        self.assertEqual(errors, [])
+
+    def test_pickle(self):
+        s = {'a': [1, 2], 'b': (3, Point(4, 5))}
+        schema = nest.to_schema(s)
+        self.assertIs(pickle.loads(pickle.dumps(schema)), schema)
+
+    def test_atomic(self):
+        s = {'a': [1, 2, 3], 'b': ([4, 5, 6], [7])}
+        schema = nest.to_schema(s, is_atomic=lambda x: isinstance(x, list))
+        self.assertEqual(schema.num_leaves, 3)
+        self.assertEqual(schema.pack(['x', 'y', 'z']), {'a': 'x', 'b': ('y', 'z')})
+
+
+@test.skipIf(np is None, 'requires numpy')
+class AccumulatorTest(test.TestCase):
+
+    def test_single_element(self):
+        accumulator = nest.Accumulator(0)
+        accumulator.update([1, 5, 3])
+        self.assertEqual(accumulator.count, 3)
+        self.assertEqual(accumulator.sum(), 9)
+        self.assertEqual(accumulator.mean(), 3.)
+        self.assertEqual(accumulator.min(), 1)
+        self.assertEqual(accumulator.max(), 5)
+
+    def test_nested(self):
+        s = [{'a': 1, 'b': [2., 3], 'c': Point(np.array([1, 2]), 4)},
+             {'a': 3, 'b': [0., 5], 'c': Point(np.array([3, 0]), 2)}]
+        accumulator = nest.Accumulator(s[0])
+        for structure in s:
+            accumulator.add(structure)
+        total = accumulator.sum()
+        self.assertEqual(total['a'], 4)
+        self.assertEqual(total['b'], [2., 8])
+        np.testing.assert_array_equal(total['c'].x, [4, 2])
+        self.assertEqual(accumulator.mean()['a'], 2.)
+        np.testing.assert_array_equal(accumulator.min()['c'].x, [1, 0])
+        np.testing.assert_array_equal(accumulator.max()['c'].x, [3, 2])
+
+    def test_does_not_alias_results(self):
+        accumulator = nest.Accumulator([np.zeros(2)])
+        accumulator.add([np.ones(2)])
+        total = accumulator.sum()
+        accumulator.add([np.ones(2)])
+        np.testing.assert_array_equal(total[0], [1, 1])
+        np.testing.assert_array_equal(accumulator.sum()[0], [2, 2])
+
+    def test_many_scalars(self):
+        s = [dict(('m{}'.format(j), float(i * j)) for j in range(100)) for i in range(5)]
+        s[0]['m0'] = 0
+        s[1]['array'] = s[0]['array'] = np.arange(3)
+        for structure in s[2:]:
+            structure['array'] = np.ones(3)
+        accumulator = nest.Accumulator(s[0])
+        accumulator.update(s)
+        total = accumulator.sum()
+        self.assertEqual(total['m7'], 70.)
+        np.testing.assert_array_equal(total['array'], [3, 5, 7])
+        self.assertEqual(accumulator.max()['m99'], 396.)
+        self.assertEqual(accumulator.min()['m1'], 0.)
+
+    def test_promotes_dtypes(self):
+        accumulator = nest.Accumulator({'loss': 0, 'steps': np.zeros(2, dtype=np.int32)})
+        accumulator.update([{'loss': 1, 'steps': np.array([1, 2], dtype=np.int32)},
+                            {'loss': 0.5, 'steps': np.array([1.5, 0.5])}])
+        self.assertEqual(accumulator.sum()['loss'], 1.5)
+        self.assertEqual(accumulator.min()['loss'], 0.5)
+        self.assertEqual(accumulator.max()['loss'], 1)
+        np.testing.assert_array_equal(accumulator.sum()['steps'], [2.5, 2.5])
+
+        other = nest.Accumulator({'loss': 0, 'steps': np.zeros(2, dtype=np.int32)})
+        other.add({'loss': 2, 'steps': np.array([3, 4], dtype=np.int32)})
+        other.merge(accumulator)
+        self.assertEqual(other.sum()['loss'], 3.5)
+        np.testing.assert_array_equal(other.min()['steps'], [1, 0.5])
+
+    def test_mismatch(self):
+        accumulator = nest.Accumulator([0, np.zeros(2)])
+        accumulator.add([1, np.ones(2)])
+        with self.assertRaises(ValueError):
+            accumulator.add([1, 2, 3])
+        with self.assertRaises(ValueError):
+            accumulator.add([1, np.ones(3)])
+        with self.assertRaises(ValueError):
+            accumulator.add((1, np.ones(2)))
+
+        accumulator = nest.Accumulator([0, 0])
+        accumulator.add([1, 2])
+        with self.assertRaises(ValueError):
+            accumulator.add([1, np.ones(2)])
+        with self.assertRaises(ValueError):
+            accumulator.add([np.ones(2), np.ones(2)])
+
+        accumulator = nest.Accumulator({'a': 0, 'b': 0})
+        with self.assertRaises(ValueError):
+            accumulator.add({'x': 10, 'y': 20})
+        with self.assertRaises(ValueError):
+            accumulator.merge(nest.Accumulator({'x': 0, 'y': 0}))
+
+        accumulator = nest.Accumulator([np.zeros(2)])
+        accumulator.add([np.ones(2)])
+        other = nest.Accumulator([np.zeros(2)])
+        other.add([np.ones(3)])
+        with self.assertRaises(ValueError):
+            accumulator.merge(other)
+
+    def test_statistics(self):
+        accumulator = nest.Accumulator([0], statistics=('max',))
+        accumulator.update([[1], [2]])
+        self.assertEqual(accumulator.max(), [2])
+        with self.assertRaises(ValueError):
+            accumulator.sum()
+        with self.assertRaises(ValueError):
+            nest.Accumulator([0], statistics=('median',))
+
+    def test_merge_and_pool(self):
+        s = [{'a': i, 'b': (np.arange(3) * i,)} for i in range(10)]
+        accumulator = nest.Accumulator(s[0])
+        pool = multiprocessing.dummy.Pool(2)
+        try:
+            accumulator.update(s, pool=pool, chunksize=3)
+        finally:
+            pool.close()
+        self.assertEqual(accumulator.count, 10)
+        self.assertEqual(accumulator.sum()['a'], 45)
+        np.testing.assert_array_equal(accumulator.max()['b'][0], [0, 9, 18])
+
+        empty = pickle.loads(pickle.dumps(accumulator._empty_like()))
+        self.assertEqual(empty.count, 0)
+        empty.add(s[1])
+        self.assertEqual(empty.sum()['a'], 1)
+
+        unpickled = pickle.loads(pickle.dumps(accumulator))
+        unpickled.merge(accumulator)
+        self.assertEqual(unpickled.count, 20)
+        self.assertEqual(unpickled.mean()['a'], 4.5)
+
+    def test_process_pool(self):
+        def structures():
+            for i in range(10):
+                yield {'a': i, 'b': [np.full(2, float(i))]}
+
+        accumulator = nest.Accumulator({'a': 0, 'b': [np.zeros(2)]})
+        pool = multiprocessing.Pool(2)
+        try:
+            accumulator.update(structures(), pool=pool, chunksize=4)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(accumulator.count, 10)
+        self.assertEqual(accumulator.sum()['a'], 45)
+        np.testing.assert_array_equal(accumulator.min()['b'][0], [0., 0.])
+        np.testing.assert_array_equal(accumulator.mean()['b'][0], [4.5, 4.5])
+
+
+@test.skipIf(np is None, 'requires numpy')
+class VectorizedTest(test.TestCase):
+
+    def test_map_scalars(self):
+        s = {'a': 1, 'b': None, 'c': [3, 4, 5, {6, 7}, (8, 9)], 'd': Point(10, 11), 'e': Coordinates(12, 13)}
+        mapped = nest.map(lambda x: x * 2, s, vectorized=True)
+        self.assertEqual(mapped, nest.map(lambda x: x * 2, s))
+        self.assertIsInstance(mapped['a'], int)
+
+    def test_common_dtype(self):
+        self.assertEqual(nest.map(lambda x: x * 2, [1, 2.5], vectorized=True), [2., 5.])
+        mapped = nest.map(lambda x: x, [np.float32(1.5), True], vectorized=True)
+        self.assertEqual([type(element) for element in mapped], [float, float])
+        filtered = nest.filter(lambda x: x > 0, [1, 2.5, -1], vectorized=True)
+        self.assertEqual([type(element) for element in filtered], [int, float])
+
+    def test_map_arrays(self):
+        s = {'a': np.array([1., 4.]), 'b': [np.array([[9.]]), 16.]}
+        mapped = nest.map(np.sqrt, s, vectorized=True)
+        np.testing.assert_array_equal(mapped['a'], [1., 2.])
+        np.testing.assert_array_equal(mapped['b'][0], [[3.]])
+        self.assertEqual(mapped['b'][1], 4.)
+
+        mapped = nest.map(lambda x: x * 2, (np.array([1, 2]), [3, 4]), is_atomic=lambda x: not isinstance(x, tuple), vectorized=True)
+        self.assertIsInstance(mapped, tuple)
+        np.testing.assert_array_equal(mapped[0], [2, 4])
+        self.assertEqual(mapped[1], [6, 8])
+
+        mapped = nest.map(lambda x: x * 2, [np.array(1), np.array(2), 3], vectorized=True)
+        self.assertIsInstance(mapped[0], np.ndarray)
+        self.assertEqual(mapped[0].shape, ())
+        self.assertEqual(mapped[1], 4)
+        self.assertIsInstance(mapped[2], int)
+
+        s = [np.arange(3), np.arange(3)]
+        mapped = nest.map(np.negative, s, vectorized=True)
+        np.testing.assert_array_equal(mapped[1], [0, -1, -2])
+
+        with self.assertRaises(ValueError):
+            nest.map(np.sum, s, vectorized=True)
+
+    def test_does_not_intern(self):
+        tables = nest.nifty_nesting._schema_keys, nest.nifty_nesting._schema_types
+        sizes = [len(table) for table in tables]
+        for i in range(10):
+            nest.map(np.negative, {'k{}'.format(i): 1}, vectorized=True)
+        self.assertEqual([len(table) for table in tables], sizes)
+
+    def test_filter(self):
+        s = {'a': 1, 'b': 2, 'c': [3, 4, 5, {6, 7}, (8, 9)], 'd': Point(10, 11), 'e': Coordinates(12, 13)}
+        for keep_structure in [True, False]:
+            f = nest.filter(lambda x: x % 2 == 0, s, keep_structure=keep_structure, vectorized=True)
+            self.assertEqual(f, nest.filter(lambda x: x % 2 == 0, s, keep_structure=keep_structure))
+        with self.assertRaises(ValueError):
+            nest.filter(lambda x: x > 0, [np.arange(3)], vectorized=True)
+
+        s = {'a': [1, None, {'b': 1}], 'c': (Point(1, 3), {5}), 'd': FrozenCoordinates(None, 1)}
+        for keep_structure in [True, False]:
+            f = nest.filter(lambda x: x > 2, s, keep_structure=keep_structure, vectorized=True)
+            self.assertEqual(f, nest.filter(lambda x: x > 2, s, keep_structure=keep_structure))
+        self.assertEqual(nest.filter(lambda x: x > 2, None, vectorized=True), None)
+        self.assertEqual(nest.filter(lambda x: x > 2, 3, vectorized=True), 3)
+        self.assertEqual(nest.filter(lambda x: x > 2, 1, vectorized=True), None)
+
+    def test_reduce(self):
+        s = {'a': 1, 'b': 2, 'c': [3, 4, 5, {6, 7}, (8, 9)], 'd': Point(10, 11), 'e': Coordinates(12, 13)}
+        self.assertEqual(nest.reduce(np.add, s, vectorized=True), sum(range(14)))
+        self.assertEqual(nest.reduce(np.maximum, s, vectorized=True), 13)
+        self.assertEqual(nest.reduce(np.add, None, vectorized=True), None)
+
+        s = [np.arange(3), (np.arange(3),)]
+        np.testing.assert_array_equal(nest.reduce(np.add, s, vectorized=True), [0, 2, 4])
+        with self.assertRaises(ValueError):
+            nest.reduce(lambda x, y: x + y, s, vectorized=True)
+        with self.assertRaises(ValueError):
+            nest.reduce(np.add, [np.arange(3), 1], vectorized=True)
+
+
 class AtomicTest(test.TestCase):
 
     def test_is_scalar(self):
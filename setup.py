@@ -15,6 +15,7 @@ setuptools.setup(name='nifty-nesting',
       url='https://github.com/aetiusflavius/nifty-nesting/',
       packages=['nifty_nesting'],
       install_requires=['attrs', 'six'],
+      extras_require={'numpy': ['numpy']},
       keywords=['nested', 'data', 'structure', 'arbitrary', 'utilities', 'manipulation'],
       classifiers=[
         'License :: OSI Approved :: MIT License',